@@ -3,9 +3,17 @@
 # Use of this source code is governed by a BSD-style license that can be
 # found in the LICENSE file. See the AUTHORS file for names of contributors.
 #
+import asyncio
+import operator
+import os
 import httpx
+import ijson
+import orjson
+import redis.asyncio
+from collections import OrderedDict, defaultdict
+from dataclasses import dataclass, fields
 from typing import List, Dict, Optional
-from pydantic import BaseModel
+from pydantic import TypeAdapter
 
 GO_CATEGORIES = {
     "BP": "biological_process",
@@ -13,7 +21,88 @@ GO_CATEGORIES = {
     "CC": "cellular_component",
 }
 
-class Annotation(BaseModel):
+# Shared across all fetches so a batch of N IDs reuses one connection pool
+# (and one TLS handshake) instead of paying the setup cost per request.
+_CLIENT = httpx.AsyncClient(
+    http2=True,
+    limits=httpx.Limits(max_connections=64, max_keepalive_connections=32),
+    timeout=httpx.Timeout(10.0),
+    headers={"Accept": "application/json", "Accept-Encoding": "gzip, br"},
+)
+
+# Only ask QuickGO for the fields we actually surface; the remaining
+# Annotation fields stay None. Pass fields=None to fetch everything.
+_DEFAULT_FIELDS = "geneProductId,goId,goName,goAspect,goEvidence,qualifier"
+
+# L2 cache shared across workers; only used when REDIS_URL is configured.
+_REDIS_URL = os.environ.get("REDIS_URL")
+_REDIS = redis.asyncio.Redis.from_url(_REDIS_URL) if _REDIS_URL else None
+_REDIS_TTL = 24 * 60 * 60  # QuickGO annotations change slowly; refresh daily
+
+# Cap in-flight QuickGO requests so a large gather neither exhausts the
+# connection pool nor trips EBI's rate limiting.
+_SEM = asyncio.Semaphore(16)
+_MAX_RETRIES = 3
+_RETRY_STATUS = {429, 500, 502, 503, 504}
+
+async def _get(url: str, params: Dict) -> httpx.Response:
+    """GET through the shared client, gated by _SEM, retrying 429/5xx
+    with exponential backoff."""
+    async with _SEM:
+        for attempt in range(_MAX_RETRIES + 1):
+            resp = await _CLIENT.get(url, params=params)
+            if resp.status_code in _RETRY_STATUS and attempt < _MAX_RETRIES:
+                await asyncio.sleep(0.5 * 2 ** attempt)
+                continue
+            resp.raise_for_status()
+            return resp
+
+def _cache_key(uniprot_id: str, fields: Optional[str]) -> str:
+    return f"quickgo:v1:{uniprot_id}:{fields or 'all'}"
+
+# In-process L1, keyed like the Redis L2. An explicit LRU rather than a
+# decorator so the batch path can consult and populate it per ID too.
+# _L1_IDS tracks the identity of cached lists for the aspect-index memo:
+# an id() appears there exactly as long as its list lives in the L1.
+_L1_MAX = 10_000
+_L1: "OrderedDict[str, List[Annotation]]" = OrderedDict()
+_L1_IDS: Dict[int, str] = {}
+
+# Aspect buckets memoized per L1-resident list; see _aspect_index.
+_INDEX_CACHE: Dict[int, Dict[str, List["Annotation"]]] = {}
+
+def _l1_get(key: str) -> Optional[List["Annotation"]]:
+    annotations = _L1.get(key)
+    if annotations is not None:
+        _L1.move_to_end(key)
+    return annotations
+
+def _l1_put(key: str, annotations: List["Annotation"]):
+    old = _L1.pop(key, None)
+    if old is not None:
+        _l1_drop(old)
+    _L1[key] = annotations
+    _L1_IDS[id(annotations)] = key
+    if len(_L1) > _L1_MAX:
+        _, evicted = _L1.popitem(last=False)
+        _l1_drop(evicted)
+
+def _l1_drop(annotations: List["Annotation"]):
+    _L1_IDS.pop(id(annotations), None)
+    _INDEX_CACHE.pop(id(annotations), None)
+
+async def aclose_client():
+    """Close the shared HTTP client; call once on service shutdown."""
+    await _CLIENT.aclose()
+    if _REDIS is not None:
+        await _REDIS.aclose()
+
+# A plain dataclass rather than a Pydantic model: QuickGO is a trusted,
+# schema-stable upstream, so per-instance validation of every annotation
+# would be pure overhead on large batches. slots avoids a per-instance
+# __dict__; frozen keeps cached instances safely shareable across requests.
+@dataclass(slots=True, frozen=True)
+class Annotation:
     id: Optional[str] = None
     geneProductId: Optional[str] = None
     qualifier: Optional[str] = None
@@ -27,33 +116,181 @@ class Annotation(BaseModel):
     name: Optional[str] = None
     reference: Optional[str] = None
 
-async def fetch_go_terms(uniprot_id: str) -> List[Annotation]:
-    """Fetch the annotations for 'uniprot_id' from the QuickGO service."""
+_FIELDS = frozenset(f.name for f in fields(Annotation))
+
+# Rebuilds a whole list of annotation dicts in one pydantic-core call;
+# used where the dicts are our own serialized output (exact field set),
+# so no unknown-key stripping is needed.
+_ANNOTATION_LIST = TypeAdapter(List[Annotation])
+
+def _make_annotation(d: Dict) -> Annotation:
+    """Build an Annotation from a QuickGO dict, ignoring unknown keys."""
+    return Annotation(**{k: d[k] for k in _FIELDS & d.keys()})
+
+async def _fetch_annotations(uniprot_id: str, fields: Optional[str]) -> List[Annotation]:
+    """Stream-parse the annotations for 'uniprot_id' from the QuickGO service.
+
+    Each result dict is turned into an Annotation as it arrives off the
+    wire, so the full payload is never buffered alongside the decoded
+    objects — peak memory stays O(1) per annotation.
+    """
     url = f"https://www.ebi.ac.uk/QuickGO/services/annotation/search"
     params = {
         "geneProductId": f"UniProtKB:{uniprot_id}",
         "limit": 100
     }
-    async with httpx.AsyncClient() as client:
-        resp = await client.get(url, params=params)
-        resp.raise_for_status()
-        data = resp.json()
-        results = [Annotation(**d) for d in data["results"]]
-        return results
+    if fields:
+        params["selectedFields"] = fields
+    async with _SEM:
+        for attempt in range(_MAX_RETRIES + 1):
+            async with _CLIENT.stream("GET", url, params=params) as resp:
+                if resp.status_code in _RETRY_STATUS and attempt < _MAX_RETRIES:
+                    await asyncio.sleep(0.5 * 2 ** attempt)
+                    continue
+                resp.raise_for_status()
+                return [
+                    _make_annotation(d)
+                    async for d in ijson.items(resp.aiter_bytes(), "results.item")
+                ]
+
+_BATCH_CHUNK = 50    # keep the comma-separated geneProductId list well under URL limits
+_BATCH_LIMIT = 2000  # QuickGO's maximum page size
+
+async def _fetch_results_batch(uniprot_ids: List[str], fields: Optional[str]) -> List[Dict]:
+    """Fetch the raw annotation dicts for up to _BATCH_CHUNK IDs in one query."""
+    url = f"https://www.ebi.ac.uk/QuickGO/services/annotation/search"
+    results = []
+    page = 1
+    while True:
+        params = {
+            "geneProductId": ",".join(f"UniProtKB:{uid}" for uid in uniprot_ids),
+            "limit": _BATCH_LIMIT,
+            "page": page,
+        }
+        if fields:
+            params["selectedFields"] = fields
+        resp = await _get(url, params)
+        data = orjson.loads(resp.content)
+        results.extend(data["results"])
+        if page >= data.get("pageInfo", {}).get("total", 1):
+            return results
+        page += 1
+
+async def fetch_go_terms_batch(
+    uniprot_ids: List[str], fields: Optional[str] = _DEFAULT_FIELDS
+) -> Dict[str, List[Annotation]]:
+    """Fetch the annotations for many UniProt IDs from the QuickGO service.
+
+    IDs warm in the L1/L2 caches are answered without touching the
+    network; only the misses are chunked into groups of _BATCH_CHUNK and
+    sent as a single comma-separated query each, so N cold IDs cost
+    ceil(N/50) requests instead of N. Returns a dict keyed by UniProt ID;
+    IDs without annotations map to an empty list.
+    """
+    results: Dict[str, List[Annotation]] = {}
+    misses: List[str] = []
+    for uid in dict.fromkeys(uniprot_ids):
+        annotations = _l1_get(_cache_key(uid, fields))
+        if annotations is not None:
+            results[uid] = annotations
+        else:
+            misses.append(uid)
+    if misses and _REDIS is not None:
+        cached = await _REDIS.mget([_cache_key(uid, fields) for uid in misses])
+        still_missing = []
+        for uid, raw in zip(misses, cached):
+            if raw is not None:
+                annotations = _ANNOTATION_LIST.validate_python(orjson.loads(raw))
+                _l1_put(_cache_key(uid, fields), annotations)
+                results[uid] = annotations
+            else:
+                still_missing.append(uid)
+        misses = still_missing
+    if misses:
+        fetched: Dict[str, List[Annotation]] = {uid: [] for uid in misses}
+        chunks = [
+            misses[start:start + _BATCH_CHUNK]
+            for start in range(0, len(misses), _BATCH_CHUNK)
+        ]
+        # TaskGroup fetches the chunks concurrently (gated by _SEM) and
+        # aggregates failures properly; results are grouped in one pass below.
+        async with asyncio.TaskGroup() as tg:
+            tasks = [tg.create_task(_fetch_results_batch(chunk, fields)) for chunk in chunks]
+        for task in tasks:
+            for d in task.result():
+                uid = (d.get("geneProductId") or "").removeprefix("UniProtKB:")
+                if uid in fetched:
+                    fetched[uid].append(_make_annotation(d))
+        if _REDIS is not None:
+            async with _REDIS.pipeline(transaction=False) as pipe:
+                for uid, annotations in fetched.items():
+                    # orjson serializes dataclasses natively, including slots ones
+                    pipe.setex(_cache_key(uid, fields), _REDIS_TTL, orjson.dumps(annotations))
+                await pipe.execute()
+        for uid, annotations in fetched.items():
+            _l1_put(_cache_key(uid, fields), annotations)
+            results[uid] = annotations
+    return {uid: results[uid] for uid in uniprot_ids}
+
+async def fetch_go_terms(
+    uniprot_id: str, fields: Optional[str] = _DEFAULT_FIELDS
+) -> List[Annotation]:
+    """Fetch the annotations for 'uniprot_id' from the QuickGO service.
+
+    Results are cached in-process (LRU) and, when REDIS_URL is set, in
+    Redis, so repeated IDs skip the network round-trip entirely.
+    """
+    key = _cache_key(uniprot_id, fields)
+    annotations = _l1_get(key)
+    if annotations is not None:
+        return annotations
+    if _REDIS is not None:
+        cached = await _REDIS.get(key)
+        if cached is not None:
+            annotations = _ANNOTATION_LIST.validate_python(orjson.loads(cached))
+            _l1_put(key, annotations)
+            return annotations
+    annotations = await _fetch_annotations(uniprot_id, fields)
+    if _REDIS is not None:
+        # orjson serializes dataclasses natively, including slots ones
+        await _REDIS.setex(key, _REDIS_TTL, orjson.dumps(annotations))
+    _l1_put(key, annotations)
+    return annotations
+
+_EMPTY: List[Annotation] = []
+
+def _aspect_index(go_terms: List[Annotation]) -> Dict[str, List[Annotation]]:
+    """Bucket 'go_terms' by goAspect, scanning the list at most once.
+
+    Only lists owned by the fetch L1 are memoized: the L1 keeps them
+    alive (so the id() key cannot be recycled) and evicts the index
+    entry together with the list, so no extra references are pinned.
+    """
+    index = _INDEX_CACHE.get(id(go_terms))
+    if index is not None:
+        return index
+    index = defaultdict(list)
+    get_aspect = operator.attrgetter("goAspect")
+    for t in go_terms:
+        index[get_aspect(t)].append(t)
+    index = dict(index)  # plain dict: lookups must not grow the index
+    if id(go_terms) in _L1_IDS:
+        _INDEX_CACHE[id(go_terms)] = index
+    return index
 
 def filter_by_category(go_terms: List[Annotation], category: str) -> List[Annotation]:
     """If 'category' is in GO_CATEGORIES, filter the go_terms by that category."""
     if category not in GO_CATEGORIES:
         return go_terms
-    return [t for t in go_terms if t.goAspect == GO_CATEGORIES[category]]
+    return _aspect_index(go_terms).get(GO_CATEGORIES[category], _EMPTY)
 
 
 if __name__ == "__main__":
-    import asyncio
     import json
     from fastapi.encoders import jsonable_encoder
 
     async def main():
         terms = await fetch_go_terms("P12345")
         print(json.dumps([jsonable_encoder(term) for term in terms[:3]], indent=2))
+        await aclose_client()
     asyncio.run(main())
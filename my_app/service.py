@@ -10,7 +10,7 @@ from pydantic import BaseModel, ConfigDict, Field
 from ivcap_service import getLogger, Service
 from ivcap_ai_tool import start_tool_server, logging_init, ToolOptions, ivcap_ai_tool
 
-from go_term_fetcher import Annotation, fetch_go_terms, filter_by_category
+from go_term_fetcher import Annotation, aclose_client, fetch_go_terms_batch, filter_by_category
 
 logging_init()
 logger = getLogger("app")
@@ -24,43 +24,48 @@ service = Service(
 )
 
 
+# Schema examples as module-level constants: defined once, shared by
+# schema generation at startup and deduplicated across forked workers.
+_REQUEST_EXAMPLE = {
+    "$schema": "urn:sd:schema.gene-ontology-term-mapper.request.1",
+    "ids": [ "P12345", "Q9H0H5" ],
+    "category": "BP"
+}
+
+# Mirrors a live response: only the default selectedFields requested
+# from QuickGO come back populated; the remaining Annotation fields
+# (id, assignedBy, symbol, ...) are null unless fetched with fields=None.
+_RESULT_EXAMPLE = {
+    "$schema": "urn:sd:schema.gene-ontology-term-mapper.1",
+    "results": {
+        "P12345": [{
+            "geneProductId": "UniProtKB:P12345",
+            "qualifier": "involved_in",
+            "goId": "GO:0006103",
+            "goName": "2-oxoglutarate metabolic process",
+            "goAspect": "biological_process",
+            "goEvidence": "ISS"
+        }]
+    }
+}
+
 class Request(BaseModel):
     jschema: str = Field("urn:sd:schema.gene-ontology-term-mapper.request.1", alias="$schema")
     ids: List[str] = Field(description="List of UniProt IDs")
     category: Optional[str] = Field(None, description="GO category: BP, MF, or CC")
 
-    model_config = ConfigDict(json_schema_extra={
-        "example": {
-            "$schema": "urn:sd:schema.gene-ontology-term-mapper.request.1",
-            "ids": [ "P12345", "Q9H0H5" ],
-            "category": "BP"
-        }
-    })
+    model_config = ConfigDict(json_schema_extra={"example": _REQUEST_EXAMPLE})
 
 class Result(BaseModel):
     jschema: str = Field("urn:sd:schema.gene-ontology-term-mapper.1", alias="$schema")
     results: Dict[str, List[Annotation]] = Field(description="contains a list of annotations for every UniProt ID")
 
-    model_config = ConfigDict(
-        json_schema_extra={
-            "example": {
-                "$schema": "urn:sd:schema.gene-ontology-term-mapper.1",
-                "results": {
-                    "P12345": [{
-                        "id": "UniProtKB:P12345!296618610",
-                        "geneProductId": "UniProtKB:P12345",
-                        "qualifier": "involved_in",
-                        "goId": "GO:0006103",
-                        "goAspect": "biological_process",
-                        "goEvidence": "ISS",
-                        "assignedBy": "UniProt",
-                        "symbol": "GOT2",
-                        "reference": "GO_REF:0000024"
-                    }]
-                }
-            }
-        },
-    )
+    model_config = ConfigDict(json_schema_extra={"example": _RESULT_EXAMPLE})
+
+# Build validators/serializers at import time so pydantic-core's lazy
+# schema construction is not charged to the first request's latency.
+Request.model_rebuild(force=True)
+Result.model_rebuild(force=True)
 
 @ivcap_ai_tool("/", opts=ToolOptions(tags=["GO Term Mapper"]))
 async def map_go_terms(
@@ -81,15 +86,37 @@ async def map_go_terms(
     * Supporting biological data exploration or hypothesis generation
     * Downstream graph or network construction for biological analysis
 """
-    results = {}
+    # Dedupe up front (order-preserving) so repeated IDs in the request
+    # cost nothing extra; the results dict covers each ID once anyway.
+    unique_ids = list(dict.fromkeys(req.ids))
+    fetched = await fetch_go_terms_batch(unique_ids)
+    results = {
+        uid: filter_by_category(terms, req.category) if req.category else terms
+        for uid, terms in fetched.items()
+    }
+    # The annotations were just built from trusted QuickGO JSON;
+    # model_construct skips revalidating every one of them.
+    return Result.model_construct(results=results)
 
-    async def fetch_and_filter(uid):
-        terms = await fetch_go_terms(uid)
-        filtered = filter_by_category(terms, req.category) if req.category else terms
-        results[uid] = filtered
+if __name__ == "__main__":
+    import atexit
 
-    await asyncio.gather(*(fetch_and_filter(i) for i in req.ids))
-    return Result(results=results)
+    try:
+        import uvloop
+        uvloop.install()
+    except ImportError:  # not available on Windows dev machines
+        pass
 
-if __name__ == "__main__":
+    # 'start_tool_server' owns the FastAPI app and exposes no lifespan
+    # hook, so the shared HTTP client is cleaned up at process exit. By
+    # then uvicorn's loop is gone; if the pooled transports refuse to
+    # close on a fresh loop there is nothing left to salvage — the
+    # process is exiting and the kernel reclaims the sockets.
+    def _close_shared_client():
+        try:
+            asyncio.run(aclose_client())
+        except RuntimeError:
+            pass
+
+    atexit.register(_close_shared_client)
     start_tool_server(service)